@@ -6,31 +6,50 @@ ESP32 TCP客户端模拟器
 """
 
 import socket
+import struct
 import time
 import argparse
 import threading
 import logging
 import sys
+import zlib
+
+from tcp_common import (DEFAULT_SOCK_BUF, HEARTBEAT_FMT, HEARTBEAT_MAGIC,
+                        configure_logging, disable_nagle, enable_keepalive,
+                        tune_buffers)
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# 命令行交互帮助
+HELP_TEXT = """
+命令帮助:
+  text <消息>     - 发送文本消息
+  hex <十六进制>  - 发送十六进制数据 (例如: hex 48 65 6c 6c 6f)
+  reconnect      - 重新连接到服务器
+  disconnect     - 断开连接
+  help           - 显示此帮助
+  exit           - 退出客户端
+"""
+
 class TcpClient:
-    def __init__(self, host='127.0.0.1', port=8080, client_id='ESP32-0001'):
+    def __init__(self, host='127.0.0.1', port=8080, client_id='ESP32-0001',
+                 rcvbuf=DEFAULT_SOCK_BUF, sndbuf=DEFAULT_SOCK_BUF):
         """初始化TCP客户端
-        
+
         Args:
             host: 服务器地址
             port: 服务器端口
             client_id: 客户端标识符
+            rcvbuf: socket接收缓冲区大小(字节)，0表示系统默认
+            sndbuf: socket发送缓冲区大小(字节)，0表示系统默认
         """
         self.host = host
         self.port = port
         self.client_id = client_id
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
         self.socket = None
         self.running = False
         self.receive_thread = None
@@ -39,6 +58,10 @@ class TcpClient:
         """连接到TCP服务器"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # 禁用Nagle算法、调整缓冲区并开启保活
+            disable_nagle(self.socket)
+            tune_buffers(self.socket, self.rcvbuf, self.sndbuf)
+            enable_keepalive(self.socket)
             self.socket.connect((self.host, self.port))
             self.running = True
             
@@ -81,8 +104,8 @@ class TcpClient:
         
         try:
             data = text.encode('utf-8')
-            self.socket.send(data)
-            logger.info(f"已发送: {text}")
+            self.socket.sendall(data)
+            logger.info("已发送: %s", text)
             return True
         
         except Exception as e:
@@ -104,9 +127,10 @@ class TcpClient:
             return False
         
         try:
-            self.socket.send(data)
-            hex_repr = ' '.join(f'{b:02x}' for b in data)
-            logger.info(f"已发送二进制数据: {hex_repr}")
+            self.socket.sendall(data)
+            # 日志级别过滤时跳过十六进制转换
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("已发送二进制数据: %s", data.hex(' '))
             return True
         
         except Exception as e:
@@ -114,23 +138,51 @@ class TcpClient:
             self.disconnect()
             return False
     
+    def send_bytes_raw(self, data):
+        """直接发送已编码好的字节数据，跳过格式化和日志
+
+        Args:
+            data: 要发送的字节数据
+
+        Returns:
+            bool: 是否成功发送
+        """
+        if not self.socket or not self.running:
+            return False
+
+        try:
+            self.socket.sendall(data)
+            return True
+
+        except Exception as e:
+            logger.error(f"发送失败: {e}")
+            self.disconnect()
+            return False
+
     def _receive_data(self):
         """接收服务器发送的数据"""
+        # 预分配接收缓冲区，避免每次recv都分配新的bytes对象
+        buf = bytearray(4096)
+        view = memoryview(buf)
+
         while self.running and self.socket:
             try:
-                data = self.socket.recv(1024)
-                if not data:
+                nbytes = self.socket.recv_into(view, 4096)
+                if not nbytes:
                     logger.warning("服务器关闭了连接")
                     break
-                
-                # 尝试解码为文本
-                try:
-                    text = data.decode('utf-8')
-                    logger.info(f"收到文本: {text}")
-                except:
-                    # 如果无法解码，则显示十六进制
-                    hex_repr = ' '.join(f'{b:02x}' for b in data)
-                    logger.info(f"收到二进制数据: {hex_repr}")
+
+                # 日志级别过滤时跳过拷贝、解码和十六进制转换
+                if logger.isEnabledFor(logging.INFO):
+                    data = bytes(view[:nbytes])
+
+                    # 用errors='replace'解码，避免二进制数据每包触发一次异常
+                    text = data.decode('utf-8', errors='replace')
+                    if '�' not in text:
+                        logger.info("收到文本: %s", text)
+                    else:
+                        # 包含无法解码的字节，显示十六进制
+                        logger.info("收到二进制数据: %s", data.hex(' '))
                 
             except ConnectionResetError:
                 logger.warning("连接被重置")
@@ -150,16 +202,7 @@ def interactive_mode(client):
     Args:
         client: TcpClient实例
     """
-    help_text = """
-命令帮助:
-  text <消息>     - 发送文本消息
-  hex <十六进制>  - 发送十六进制数据 (例如: hex 48 65 6c 6c 6f)
-  reconnect      - 重新连接到服务器
-  disconnect     - 断开连接
-  help           - 显示此帮助
-  exit           - 退出客户端
-"""
-    print(help_text)
+    print(HELP_TEXT)
     
     while True:
         try:
@@ -171,7 +214,7 @@ def interactive_mode(client):
                 break
                 
             elif cmd == "help":
-                print(help_text)
+                print(HELP_TEXT)
                 
             elif cmd == "reconnect":
                 client.disconnect()
@@ -194,10 +237,8 @@ def interactive_mode(client):
                 
             elif cmd.startswith("hex "):
                 try:
-                    # 解析十六进制字符串为字节数组
-                    hex_str = cmd[4:].strip()
-                    hex_values = hex_str.split()
-                    data = bytes([int(h, 16) for h in hex_values])
+                    # 解析十六进制字符串为字节数组（fromhex为C实现，一次完成）
+                    data = bytes.fromhex(cmd[4:].replace(' ', ''))
                     
                     if client.send_binary(data):
                         pass  # 日志已经在方法内部打印
@@ -225,14 +266,17 @@ def send_periodic_heartbeat(client, interval=5):
         client: TcpClient实例
         interval: 心跳间隔(秒)
     """
+    # 固定12字节的二进制帧替代UTF-8文本，带宽减少约60%且服务器可O(1)解析
+    id_hash = zlib.crc32(client.client_id.encode('utf-8'))
     counter = 0
-    
+
     while client.running:
         time.sleep(interval)
         counter += 1
         if client.running:
-            message = f"{client.client_id} 心跳 #{counter}"
-            client.send_text(message)
+            frame = struct.pack(HEARTBEAT_FMT, HEARTBEAT_MAGIC,
+                                id_hash, counter & 0xFFFFFFFF)
+            client.send_bytes_raw(frame)
 
 
 def main():
@@ -243,10 +287,14 @@ def main():
     parser.add_argument('--id', default='ESP32-0001', help='客户端ID (默认: ESP32-0001)')
     parser.add_argument('--heartbeat', action='store_true', help='启用心跳包 (默认关闭)')
     parser.add_argument('--interval', type=int, default=5, help='心跳间隔，单位秒 (默认: 5)')
+    parser.add_argument('--rcvbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket接收缓冲区大小(字节)，0表示系统默认')
+    parser.add_argument('--sndbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket发送缓冲区大小(字节)，0表示系统默认')
     args = parser.parse_args()
-    
+
     # 创建客户端
-    client = TcpClient(args.host, args.port, args.id)
+    client = TcpClient(args.host, args.port, args.id, args.rcvbuf, args.sndbuf)
     
     # 连接到服务器
     if not client.connect():
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TCP测试工具公共模块
+服务器和客户端共用的常量与socket调优函数
+"""
+
+import atexit
+import queue
+import socket
+import struct
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# 统一的日志输出格式
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 默认socket收发缓冲区大小（4MB），0表示保留系统默认值
+DEFAULT_SOCK_BUF = 4 * 1024 * 1024
+
+# 二进制心跳帧: 4字节魔数 + 客户端ID的CRC32(uint32) + 计数器(uint32)，共12字节
+HEARTBEAT_FMT = '<4sII'
+HEARTBEAT_MAGIC = b'HB\x00\x00'
+HEARTBEAT_SIZE = struct.calcsize(HEARTBEAT_FMT)
+
+
+def configure_logging():
+    """配置统一的日志输出
+
+    热路径上的logger调用只向队列无锁入队，格式化和stderr写入
+    由后台QueueListener线程完成，避免各线程在日志句柄锁上串行化
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        # 已配置过，避免重复启动listener
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    # 进程退出时停止listener，确保队列中的日志全部写出
+    atexit.register(listener.stop)
+
+
+def disable_nagle(sock):
+    """禁用Nagle算法，降低小包（心跳、命令）的发送延迟
+
+    Args:
+        sock: 要设置的socket
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, 'TCP_QUICKACK'):
+        # Linux: 关闭延迟ACK，避免与Nagle交互产生40ms延迟
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+
+def tune_buffers(sock, rcvbuf, sndbuf):
+    """设置socket收发缓冲区大小，0表示保留系统默认
+
+    Args:
+        sock: 要设置的socket
+        rcvbuf: 接收缓冲区大小(字节)
+        sndbuf: 发送缓冲区大小(字节)
+    """
+    if rcvbuf > 0:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if sndbuf > 0:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+
+
+def enable_keepalive(sock):
+    """开启TCP保活，及时发现掉线的对端
+
+    Args:
+        sock: 要设置的socket
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Linux: 空闲60秒后开始探测，每10秒一次，3次无响应判定掉线
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
@@ -5,7 +5,9 @@ ESP32 TCP服务器测试工具
 用于接收和响应ESP32设备的TCP连接请求
 """
 
+import os
 import socket
+import selectors
 import time
 import argparse
 import threading
@@ -13,29 +15,46 @@ import logging
 import sys
 import signal
 
+from tcp_common import (DEFAULT_SOCK_BUF, configure_logging,
+                        disable_nagle, enable_keepalive, tune_buffers)
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # 全局变量
 running = True
 
 class TcpServer:
-    def __init__(self, host='0.0.0.0', port=8080):
+    # 回复内容中只有字节数是变化的，前后缀预先编码好
+    _REPLY_PREFIX = "服务器已接收 ".encode('utf-8')
+    _REPLY_SUFFIX = " 字节".encode('utf-8')
+
+    def __init__(self, host='0.0.0.0', port=8080,
+                 rcvbuf=DEFAULT_SOCK_BUF, sndbuf=DEFAULT_SOCK_BUF):
         """初始化TCP服务器
-        
+
         Args:
             host: 服务器监听地址，默认所有地址
             port: 服务器监听端口
+            rcvbuf: socket接收缓冲区大小(字节)，0表示系统默认
+            sndbuf: socket发送缓冲区大小(字节)，0表示系统默认
         """
         self.host = host
         self.port = port
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
         self.server_socket = None
-        self.clients = []
+        self.clients = {}  # 客户端连接字典 {id(socket): socket}
+        self.clients_lock = threading.Lock()
         self.running = False
+        # 单线程reactor：用epoll同时监听所有连接，替代每客户端一个线程
+        self.selector = None
+        # 自管道：stop()写入一个字节即可立刻唤醒阻塞中的select
+        self._wake_r, self._wake_w = os.pipe()
+        # 预分配接收缓冲区，避免每次recv都分配新的bytes对象
+        self._recv_buf = bytearray(4096)
+        self._recv_view = memoryview(self._recv_buf)
         
     def start(self):
         """启动TCP服务器"""
@@ -43,16 +62,25 @@ class TcpServer:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
+            tune_buffers(self.server_socket, self.rcvbuf, self.sndbuf)
             self.server_socket.listen(5)
-            
+            self.server_socket.setblocking(False)
+
+            # 注册监听socket，可读事件即有新连接
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.server_socket, selectors.EVENT_READ,
+                                   self._accept_connection)
+            self.selector.register(self._wake_r, selectors.EVENT_READ,
+                                   lambda fd: os.read(fd, 64))
+
             self.running = True
             logger.info(f"服务器启动，监听 {self.host}:{self.port}")
-            
-            # 启动接收线程
-            accept_thread = threading.Thread(target=self._accept_connections)
-            accept_thread.daemon = True
-            accept_thread.start()
-            
+
+            # 启动reactor线程，一个线程处理所有连接
+            reactor_thread = threading.Thread(target=self._reactor_loop)
+            reactor_thread.daemon = True
+            reactor_thread.start()
+
             return True
             
         except Exception as e:
@@ -62,16 +90,22 @@ class TcpServer:
     def stop(self):
         """停止TCP服务器"""
         self.running = False
-        
+
+        # 唤醒阻塞在select中的reactor线程
+        try:
+            os.write(self._wake_w, b'\x00')
+        except OSError:
+            pass
+
         # 关闭所有客户端连接
-        for client in self.clients:
-            try:
-                client.close()
-            except:
-                pass
-        
-        self.clients = []
-        
+        with self.clients_lock:
+            for client in self.clients.values():
+                try:
+                    client.close()
+                except:
+                    pass
+            self.clients.clear()
+
         # 关闭服务器
         if self.server_socket:
             try:
@@ -79,74 +113,112 @@ class TcpServer:
             except:
                 pass
             self.server_socket = None
-            
+
+        if self.selector:
+            try:
+                self.selector.close()
+            except:
+                pass
+            self.selector = None
+
         logger.info("服务器已停止")
-    
-    def _accept_connections(self):
-        """接受客户端连接的线程"""
+
+    def _reactor_loop(self):
+        """reactor线程：等待所有已注册socket的可读事件"""
         while self.running:
             try:
-                self.server_socket.settimeout(1.0)
-                client_socket, addr = self.server_socket.accept()
-                
-                logger.info(f"接受来自 {addr[0]}:{addr[1]} 的连接")
-                
-                # 将客户端添加到列表
-                self.clients.append(client_socket)
-                
-                # 为每个客户端创建一个处理线程
-                client_thread = threading.Thread(
-                    target=self._handle_client,
-                    args=(client_socket, addr)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    logger.error(f"接受连接时出错: {e}")
+                # 无超时阻塞等待，stop()通过自管道唤醒，空闲时零唤醒
+                events = self.selector.select()
+            except OSError:
                 break
-    
-    def _handle_client(self, client_socket, addr):
-        """处理客户端数据
-        
+            for key, mask in events:
+                key.data(key.fileobj)
+
+    def _accept_connection(self, server_socket):
+        """接受一个新的客户端连接
+
+        Args:
+            server_socket: 监听socket
+        """
+        try:
+            client_socket, addr = server_socket.accept()
+        except OSError as e:
+            if self.running:
+                logger.error(f"接受连接时出错: {e}")
+            return
+
+        # 禁用Nagle算法、调整缓冲区并开启保活
+        disable_nagle(client_socket)
+        tune_buffers(client_socket, self.rcvbuf, self.sndbuf)
+        enable_keepalive(client_socket)
+
+        # 地址字符串在整个连接期间不变，只格式化一次
+        addr_str = f"{addr[0]}:{addr[1]}"
+
+        logger.info(f"接受来自 {addr_str} 的连接")
+
+        # 将客户端添加到字典并注册到reactor
+        with self.clients_lock:
+            self.clients[id(client_socket)] = client_socket
+        self.selector.register(
+            client_socket, selectors.EVENT_READ,
+            lambda sock, addr_str=addr_str: self._handle_client(sock, addr_str)
+        )
+
+    def _handle_client(self, client_socket, addr_str):
+        """处理客户端的一次可读事件
+
         Args:
             client_socket: 客户端socket
-            addr: 客户端地址
+            addr_str: 客户端地址字符串 "ip:port"
         """
         try:
-            while self.running:
-                # 接收数据
-                data = client_socket.recv(1024)
-                
-                if not data:
-                    logger.info(f"客户端 {addr[0]}:{addr[1]} 断开连接")
-                    break
-                
-                # 打印接收到的数据
-                try:
-                    decoded = data.decode('utf-8')
-                    logger.info(f"从 {addr[0]}:{addr[1]} 接收: {decoded}")
-                except UnicodeDecodeError:
-                    logger.info(f"从 {addr[0]}:{addr[1]} 接收二进制数据: {data.hex()}")
-                
-                # 回复客户端
-                reply = f"服务器已接收 {len(data)} 字节"
-                client_socket.send(reply.encode('utf-8'))
-                
+            # 接收数据到预分配缓冲区（reactor单线程，缓冲区可复用）
+            nbytes = client_socket.recv_into(self._recv_view, 4096)
         except Exception as e:
-            logger.error(f"处理客户端 {addr[0]}:{addr[1]} 时出错: {e}")
-        
-        finally:
-            # 关闭连接并从列表中删除
-            try:
-                client_socket.close()
-                if client_socket in self.clients:
-                    self.clients.remove(client_socket)
-            except:
-                pass
+            logger.error("处理客户端 %s 时出错: %s", addr_str, e)
+            self._close_client(client_socket)
+            return
+
+        if not nbytes:
+            logger.info("客户端 %s 断开连接", addr_str)
+            self._close_client(client_socket)
+            return
+
+        # 打印接收到的数据（日志级别过滤时跳过拷贝和解码）
+        if logger.isEnabledFor(logging.INFO):
+            data = bytes(self._recv_view[:nbytes])
+            # 用errors='replace'解码，避免二进制数据每包触发一次异常
+            decoded = data.decode('utf-8', errors='replace')
+            if '�' not in decoded:
+                logger.info("从 %s 接收: %s", addr_str, decoded)
+            else:
+                logger.info("从 %s 接收二进制数据: %s", addr_str, data.hex(' '))
+
+        # 回复客户端（回复很小，直接在reactor线程中发送）
+        try:
+            reply = self._REPLY_PREFIX + str(nbytes).encode('ascii') + self._REPLY_SUFFIX
+            client_socket.sendall(reply)
+        except Exception as e:
+            logger.error("处理客户端 %s 时出错: %s", addr_str, e)
+            self._close_client(client_socket)
+
+    def _close_client(self, client_socket):
+        """关闭客户端连接并从reactor注销
+
+        Args:
+            client_socket: 客户端socket
+        """
+        try:
+            self.selector.unregister(client_socket)
+        except (KeyError, ValueError):
+            pass
+        with self.clients_lock:
+            self.clients.pop(id(client_socket), None)
+        try:
+            client_socket.close()
+        except:
+            pass
 
 def signal_handler(sig, frame):
     """处理中断信号"""
@@ -162,13 +234,17 @@ def main():
     parser = argparse.ArgumentParser(description='TCP服务器测试工具')
     parser.add_argument('--host', default='0.0.0.0', help='服务器监听地址')
     parser.add_argument('--port', type=int, default=8080, help='服务器监听端口')
+    parser.add_argument('--rcvbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket接收缓冲区大小(字节)，0表示系统默认')
+    parser.add_argument('--sndbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket发送缓冲区大小(字节)，0表示系统默认')
     args = parser.parse_args()
-    
+
     # 处理中断信号
     signal.signal(signal.SIGINT, signal_handler)
-    
+
     # 创建并启动服务器
-    server = TcpServer(args.host, args.port)
+    server = TcpServer(args.host, args.port, args.rcvbuf, args.sndbuf)
     if not server.start():
         sys.exit(1)
     
@@ -5,254 +5,286 @@ ESP32设备TCP测试服务器
 该服务器接收ESP32设备发送的TCP数据，并可以向设备发送命令
 """
 
-import socket
-import threading
-import time
+import asyncio
+import struct
+import sys
 import argparse
-import binascii
 import logging
 
+from tcp_common import (DEFAULT_SOCK_BUF, HEARTBEAT_FMT, HEARTBEAT_MAGIC,
+                        HEARTBEAT_SIZE, configure_logging, disable_nagle,
+                        enable_keepalive, tune_buffers)
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# 命令行交互帮助
+HELP_TEXT = """
+命令帮助:
+  list           - 列出所有连接的客户端
+  send <索引> <消息> - 向指定客户端发送消息
+  broadcast <消息>  - 向所有客户端广播消息
+  help           - 显示此帮助
+  exit           - 退出服务器
+"""
+
 class TcpServer:
-    def __init__(self, host='0.0.0.0', port=8080):
+    # 确认消息中只有字节数是变化的，前后缀预先编码好
+    _REPLY_PREFIX = "已收到数据: ".encode('utf-8')
+    _REPLY_SUFFIX = "字节".encode('utf-8')
+
+    def __init__(self, host='0.0.0.0', port=8080,
+                 rcvbuf=DEFAULT_SOCK_BUF, sndbuf=DEFAULT_SOCK_BUF):
         """初始化TCP服务器
-        
+
         Args:
             host: 服务器监听的地址，默认为所有地址
             port: 服务器监听的端口，默认为8080
+            rcvbuf: socket接收缓冲区大小(字节)，0表示系统默认
+            sndbuf: socket发送缓冲区大小(字节)，0表示系统默认
         """
         self.host = host
         self.port = port
-        self.server_socket = None
-        self.clients = {}  # 客户端连接字典 {addr: socket}
-        self.clients_lock = threading.Lock()
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.server = None
+        self.clients = {}  # 客户端连接字典 {addr: writer}
         self.running = False
-    
+
     def start(self):
         """启动TCP服务器"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            self.running = True
-            
-            logger.info(f"TCP服务器已启动，监听地址: {self.host}:{self.port}")
-            
-            # 启动接受连接的线程
-            accept_thread = threading.Thread(target=self._accept_connections)
-            accept_thread.daemon = True
-            accept_thread.start()
-            
-            # 启动命令行交互线程
-            cmd_thread = threading.Thread(target=self._command_interface)
-            cmd_thread.daemon = True
-            cmd_thread.start()
-            
-            # 主线程保持运行
-            while self.running:
-                time.sleep(1)
-                
+            asyncio.run(self._serve())
         except KeyboardInterrupt:
             logger.info("收到中断信号，服务器正在关闭...")
         except Exception as e:
             logger.error(f"服务器出错: {e}")
+
+    async def _serve(self):
+        """事件循环主体，监听端口并等待退出"""
+        self.running = True
+        self.server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+
+        # 调整监听socket的收发缓冲区
+        for sock in self.server.sockets:
+            tune_buffers(sock, self.rcvbuf, self.sndbuf)
+
+        logger.info(f"TCP服务器已启动，监听地址: {self.host}:{self.port}")
+
+        # 启动命令行交互任务
+        cmd_task = asyncio.create_task(self._command_interface())
+
+        try:
+            # 保持运行直到收到退出请求
+            while self.running:
+                await asyncio.sleep(1)
         finally:
-            self.stop()
-    
+            cmd_task.cancel()
+            await self._close_all()
+
+    async def _close_all(self):
+        """关闭所有客户端连接和服务器套接字"""
+        for writer in self.clients.values():
+            try:
+                writer.close()
+            except:
+                pass
+        self.clients.clear()
+
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+        logger.info("服务器已关闭")
+
     def stop(self):
         """停止TCP服务器"""
         self.running = False
-        
-        # 关闭所有客户端连接
-        with self.clients_lock:
-            for client_socket in self.clients.values():
-                try:
-                    client_socket.close()
-                except:
-                    pass
-            self.clients.clear()
-        
-        # 关闭服务器套接字
-        if self.server_socket:
-            self.server_socket.close()
-            self.server_socket = None
-        
-        logger.info("服务器已关闭")
-    
-    def _accept_connections(self):
-        """接受新的客户端连接"""
-        while self.running:
-            try:
-                client_socket, client_addr = self.server_socket.accept()
-                client_socket.settimeout(60)  # 设置超时
-                
-                # 将新客户端添加到字典
-                with self.clients_lock:
-                    self.clients[client_addr] = client_socket
-                
-                logger.info(f"新客户端连接: {client_addr[0]}:{client_addr[1]}")
-                
-                # 为每个客户端创建一个处理线程
-                client_thread = threading.Thread(
-                    target=self._handle_client,
-                    args=(client_socket, client_addr)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-            except Exception as e:
-                if self.running:
-                    logger.error(f"接受连接出错: {e}")
-    
-    def _handle_client(self, client_socket, client_addr):
-        """处理客户端连接
-        
+
+    async def _handle_client(self, reader, writer):
+        """处理客户端连接（每个连接一个协程）
+
         Args:
-            client_socket: 客户端套接字
-            client_addr: 客户端地址 (ip, port)
+            reader: 客户端读取流
+            writer: 客户端写入流
         """
+        client_addr = writer.get_extra_info('peername')
+
+        # 禁用Nagle算法、调整缓冲区并开启保活
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            disable_nagle(sock)
+            tune_buffers(sock, self.rcvbuf, self.sndbuf)
+            enable_keepalive(sock)
+
+        # 地址字符串在整个连接期间不变，只格式化一次
+        addr_str = f"{client_addr[0]}:{client_addr[1]}"
+
+        # 将新客户端添加到字典（单线程事件循环，无需加锁）
+        self.clients[client_addr] = writer
+
+        logger.info(f"新客户端连接: {addr_str}")
+
         try:
             while self.running:
                 # 接收数据
-                data = client_socket.recv(1024)
+                data = await reader.read(1024)
                 if not data:
-                    logger.info(f"客户端 {client_addr[0]}:{client_addr[1]} 断开连接")
+                    logger.info("客户端 %s 断开连接", addr_str)
                     break
-                
+
                 # 处理接收到的数据
-                self._process_data(client_socket, client_addr, data)
-                
-        except socket.timeout:
-            logger.warning(f"客户端 {client_addr[0]}:{client_addr[1]} 连接超时")
+                await self._process_data(writer, addr_str, data)
+
+        except asyncio.CancelledError:
+            # 服务器关闭时任务被取消，静默退出
+            pass
         except ConnectionResetError:
-            logger.warning(f"客户端 {client_addr[0]}:{client_addr[1]} 连接重置")
+            logger.warning("客户端 %s 连接重置", addr_str)
         except Exception as e:
-            logger.error(f"处理客户端 {client_addr[0]}:{client_addr[1]} 时出错: {e}")
+            logger.error("处理客户端 %s 时出错: %s", addr_str, e)
         finally:
             # 关闭连接并从字典中移除
-            client_socket.close()
-            with self.clients_lock:
-                if client_addr in self.clients:
-                    del self.clients[client_addr]
-            logger.info(f"客户端 {client_addr[0]}:{client_addr[1]} 已断开连接")
-    
-    def _process_data(self, client_socket, client_addr, data):
+            writer.close()
+            self.clients.pop(client_addr, None)
+            logger.info("客户端 %s 已断开连接", addr_str)
+
+    async def _process_data(self, writer, addr_str, data):
         """处理收到的数据
-        
+
         Args:
-            client_socket: 客户端套接字
-            client_addr: 客户端地址
+            writer: 客户端写入流
+            addr_str: 客户端地址字符串 "ip:port"
             data: 接收到的二进制数据
         """
-        try:
-            # 尝试将数据解码为字符串
+        # 二进制心跳帧直接解包，无需utf-8解码
+        if len(data) == HEARTBEAT_SIZE and data.startswith(HEARTBEAT_MAGIC):
+            _, id_hash, counter = struct.unpack(HEARTBEAT_FMT, data)
+            logger.info("收到来自 %s 的心跳: 设备 %08x #%d", addr_str, id_hash, counter)
+        # 日志级别过滤时跳过解码工作
+        elif logger.isEnabledFor(logging.INFO):
+            # errors='replace'不会抛出异常，无需try/except
             text_data = data.decode('utf-8', errors='replace')
-            logger.info(f"收到来自 {client_addr[0]}:{client_addr[1]} 的文本数据: {text_data}")
-        except:
-            # 如果解码失败，则显示为十六进制
-            hex_data = binascii.hexlify(data).decode('ascii')
-            logger.info(f"收到来自 {client_addr[0]}:{client_addr[1]} 的二进制数据: {hex_data}")
-        
+            if '�' not in text_data:
+                logger.info("收到来自 %s 的文本数据: %s", addr_str, text_data)
+            else:
+                # 包含无法解码的字节，显示十六进制
+                logger.info("收到来自 %s 的二进制数据: %s", addr_str, data.hex(' '))
+
         # 向客户端发送确认消息
         try:
-            response = f"已收到数据: {len(data)}字节".encode('utf-8')
-            client_socket.send(response)
+            response = self._REPLY_PREFIX + str(len(data)).encode('ascii') + self._REPLY_SUFFIX
+            writer.write(response)
+            await writer.drain()
         except Exception as e:
-            logger.error(f"向客户端 {client_addr[0]}:{client_addr[1]} 发送响应时出错: {e}")
-    
-    def _command_interface(self):
-        """命令行交互界面"""
-        help_text = """
-命令帮助:
-  list           - 列出所有连接的客户端
-  send <索引> <消息> - 向指定客户端发送消息
-  broadcast <消息>  - 向所有客户端广播消息
-  help           - 显示此帮助
-  exit           - 退出服务器
-"""
-        print(help_text)
-        
-        while self.running:
-            try:
-                cmd = input("TCP服务器> ").strip()
-                if not cmd:
-                    continue
-                
-                if cmd == "exit":
-                    logger.info("用户请求退出")
-                    self.running = False
-                    break
-                    
-                elif cmd == "help":
-                    print(help_text)
-                    
-                elif cmd == "list":
-                    with self.clients_lock:
+            logger.error("向客户端 %s 发送响应时出错: %s", addr_str, e)
+
+    async def _command_interface(self):
+        """命令行交互界面（stdin注册到事件循环，不占用线程）"""
+        print(HELP_TEXT)
+
+        loop = asyncio.get_running_loop()
+
+        # stdin可读时将整行放入队列，由协程消费，无需独占线程
+        lines = asyncio.Queue()
+        loop.add_reader(sys.stdin.fileno(),
+                        lambda: lines.put_nowait(sys.stdin.readline()))
+
+        try:
+            while self.running:
+                try:
+                    print("TCP服务器> ", end='', flush=True)
+                    line = await lines.get()
+                    if not line:
+                        # stdin已关闭(EOF)，请求退出
+                        logger.info("输入结束，服务器退出")
+                        self.running = False
+                        break
+                    cmd = line.strip()
+                    if not cmd:
+                        continue
+
+                    if cmd == "exit":
+                        logger.info("用户请求退出")
+                        self.running = False
+                        break
+
+                    elif cmd == "help":
+                        print(HELP_TEXT)
+
+                    elif cmd == "list":
                         if not self.clients:
                             print("没有连接的客户端")
                         else:
                             print("连接的客户端:")
                             for i, addr in enumerate(self.clients.keys()):
                                 print(f"  [{i}] {addr[0]}:{addr[1]}")
-                
-                elif cmd.startswith("send "):
-                    parts = cmd.split(" ", 2)
-                    if len(parts) < 3:
-                        print("格式错误, 使用: send <索引> <消息>")
-                        continue
-                    
-                    try:
-                        idx = int(parts[1])
-                        message = parts[2]
-                        
-                        with self.clients_lock:
+
+                    elif cmd.startswith("send "):
+                        parts = cmd.split(" ", 2)
+                        if len(parts) < 3:
+                            print("格式错误, 使用: send <索引> <消息>")
+                            continue
+
+                        try:
+                            idx = int(parts[1])
+                            message = parts[2]
+
                             if not self.clients or idx < 0 or idx >= len(self.clients):
                                 print(f"客户端索引 {idx} 不存在")
                                 continue
-                            
+
                             client_addr = list(self.clients.keys())[idx]
-                            client_socket = self.clients[client_addr]
-                            
+                            writer = self.clients[client_addr]
+
                             try:
-                                client_socket.send(message.encode('utf-8'))
+                                writer.write(message.encode('utf-8'))
+                                await writer.drain()
                                 print(f"消息已发送到 {client_addr[0]}:{client_addr[1]}")
                             except Exception as e:
                                 print(f"发送消息失败: {e}")
-                    
-                    except ValueError:
-                        print("索引必须是一个数字")
-                
-                elif cmd.startswith("broadcast "):
-                    message = cmd[10:]  # 去掉"broadcast "前缀
-                    
-                    with self.clients_lock:
+
+                        except ValueError:
+                            print("索引必须是一个数字")
+
+                    elif cmd.startswith("broadcast "):
+                        message = cmd[10:]  # 去掉"broadcast "前缀
+
                         if not self.clients:
                             print("没有连接的客户端")
                         else:
+                            # 只编码一次，先快照再发送，避免迭代中字典被修改
+                            payload = message.encode('utf-8')
+                            targets = list(self.clients.values())
+
                             failed = 0
-                            for addr, sock in self.clients.items():
+                            drains = []
+                            for writer in targets:
                                 try:
-                                    sock.send(message.encode('utf-8'))
+                                    writer.write(payload)
+                                    drains.append(writer.drain())
                                 except:
                                     failed += 1
-                            
-                            print(f"广播消息已发送到 {len(self.clients) - failed}/{len(self.clients)} 个客户端")
-                
-                else:
-                    print(f"未知命令: {cmd}，输入 'help' 查看可用命令")
-                    
-            except KeyboardInterrupt:
-                self.running = False
-                break
-            except Exception as e:
-                logger.error(f"命令处理出错: {e}")
+
+                            # 并发等待所有客户端的发送缓冲清空
+                            results = await asyncio.gather(*drains, return_exceptions=True)
+                            failed += sum(1 for r in results if isinstance(r, Exception))
+
+                            print(f"广播消息已发送到 {len(targets) - failed}/{len(targets)} 个客户端")
+
+                    else:
+                        print(f"未知命令: {cmd}，输入 'help' 查看可用命令")
+
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"命令处理出错: {e}")
+        finally:
+            loop.remove_reader(sys.stdin.fileno())
 
 
 def main():
@@ -260,9 +292,13 @@ def main():
     parser = argparse.ArgumentParser(description='ESP32 TCP测试服务器')
     parser.add_argument('--host', default='0.0.0.0', help='服务器监听地址 (默认: 0.0.0.0)')
     parser.add_argument('--port', type=int, default=8080, help='服务器监听端口 (默认: 8080)')
+    parser.add_argument('--rcvbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket接收缓冲区大小(字节)，0表示系统默认')
+    parser.add_argument('--sndbuf', type=int, default=DEFAULT_SOCK_BUF,
+                        help='socket发送缓冲区大小(字节)，0表示系统默认')
     args = parser.parse_args()
-    
-    server = TcpServer(args.host, args.port)
+
+    server = TcpServer(args.host, args.port, args.rcvbuf, args.sndbuf)
     try:
         server.start()
     except KeyboardInterrupt:
@@ -272,4 +308,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()